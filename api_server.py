@@ -6,46 +6,151 @@ Run: python api_server.py
 This creates an API that the extension can call to get message format settings
 """
 
-from flask import Flask, jsonify, request
+from startup import timer, load_env
+from flask import Flask, jsonify, request, g
 from flask_cors import CORS
-import json
 import os
-import requests
 import logging
-from dotenv import load_dotenv
+import threading
+import time
+timer.mark("import_flask")
+
+from storage import store, USER_CONFIGS
+from log_setup import setup_logging, start_request
+timer.mark("import_app")
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 # Setup logging
-logging.basicConfig(
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+setup_logging()
 logger = logging.getLogger(__name__)
+timer.mark("setup_logging")
 
 app = Flask(__name__)
 CORS(app)  # Allow requests from Chrome extension
 
-CONFIG_FILE = "user_configs.json"
+@app.before_request
+def tag_request():
+    """Give each request an id for log correlation"""
+    g.request_id = start_request(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    return response
+
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
-def load_configs():
-    """Load user configurations from file"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+# Seconds to wait for Telegram before giving up on a send
+TELEGRAM_TIMEOUT = 10
+
+def get_config(user_id):
+    """Load one user's configuration from the store (None if not set)"""
+    return store.get(USER_CONFIGS, user_id)
+
+# Pending delayed / quiet-hours posts; the scheduler module is only imported
+# on first use so it stays off the startup path
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Create the post scheduler on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from scheduler import PostScheduler
+            _scheduler = PostScheduler()
+        return _scheduler
+
+def run_scheduler():
+    """Background thread: load the scheduler and send posts as they come due"""
+    get_scheduler().run(send_scheduled_post)
+
+def send_to_telegram(channel_id, message):
+    """Post a message to a Telegram channel and return the API result"""
+    # Imported here so startup doesn't pay for requests until the first send
+    import requests
+    
+    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+    logger.debug("Sending to Telegram chat %s", channel_id)
+    
+    payload = {
+        "chat_id": channel_id,
+        "text": message,
+        "parse_mode": "Markdown",
+        "disable_web_page_preview": False
+    }
+    logger.debug("Payload: %s", payload)
+    
+    response = requests.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
+    if response.status_code >= 500:
+        # Telegram outages often return HTML rather than JSON
+        result = {"ok": False, "error_code": response.status_code, "description": response.reason}
+    else:
+        result = response.json()
+    
+    logger.debug("Telegram response: %s", result)
+    return result
+
+def is_connect_error(error):
+    """True if a requests error happened before the request reached Telegram"""
+    import requests
+    from urllib3.exceptions import MaxRetryError
+    
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests wraps failures to open the connection in MaxRetryError; resets
+    # and read timeouts after the request went out are not wrapped
+    return (
+        isinstance(error, requests.exceptions.ConnectionError)
+        and bool(error.args)
+        and isinstance(error.args[0], MaxRetryError)
+    )
+
+def send_scheduled_post(post):
+    """Send a post that was held back by the scheduler
+
+    Returns True if it went out and False on errors that won't go away
+    (bad chat id, bad Markdown, bot kicked). Raises RetrySend on rate
+    limits, Telegram 5xx and connection failures.
+    """
+    import requests
+    from scheduler import RetrySend
+    
+    start_request()
+    try:
+        result = send_to_telegram(post["channel_id"], post["message"])
+    except requests.exceptions.RequestException as e:
+        if is_connect_error(e):
+            raise RetrySend(f"connection failed: {e}")
+        # e.g. a read timeout: Telegram may already have posted it, so don't resend
+        logger.error("❌ Scheduled post to %s may not have been sent: %s", post['channel_id'], e)
+        return False
+    
+    if result.get('ok'):
+        logger.info("✅ Scheduled message sent to %s", post['channel_id'])
+        return True
+    
+    error_code = result.get('error_code')
+    description = result.get('description', 'Unknown error')
+    if error_code == 429:
+        raise RetrySend(description, result.get('parameters', {}).get('retry_after'))
+    if error_code and error_code >= 500:
+        raise RetrySend(description)
+    
+    logger.error("❌ Telegram error for scheduled post: %s", description)
+    return False
 
 @app.route('/api/config/<user_id>', methods=['GET'])
 def get_user_config(user_id):
     """Get configuration for a specific user"""
-    configs = load_configs()
+    config = get_config(user_id)
     
-    if user_id in configs:
+    if config is not None:
         return jsonify({
             "success": True,
-            "config": configs[user_id]
+            "config": config
         })
     else:
         # Return default config
@@ -61,18 +166,17 @@ def get_user_config(user_id):
 def send_video():
     """Receive video from extension and post to Telegram"""
     try:
-        logger.debug(f"Received request to /api/send-video")
-        logger.debug(f"Request data: {request.json}")
-        
         data = request.json
+        logger.debug("Received request to /api/send-video: %s", data)
+        
         channel_id = data.get('channel_id')
         user_id = data.get('user_id')
         message = data.get('message')
         
-        logger.info(f"Processing video for user {user_id} to channel {channel_id}")
+        logger.info("Processing video for user %s to channel %s", user_id, channel_id)
         
         if not channel_id or not message:
-            logger.error(f"Missing required fields - channel_id: {channel_id}, message: {bool(message)}")
+            logger.error("Missing required fields - channel_id: %s, message: %s", channel_id, bool(message))
             return jsonify({
                 "success": False,
                 "error": "Missing channel_id or message"
@@ -85,41 +189,44 @@ def send_video():
                 "error": "Bot token not configured on server"
             }), 500
         
-        logger.debug(f"Bot token found: {BOT_TOKEN[:10]}...")
+        # Hold the post back if the user configured a delay or quiet hours
+        from scheduler import compute_send_time
+        config = get_config(user_id) or {}
+        now = time.time()
+        send_at = compute_send_time(config, now)
+        if send_at - now >= 1:
+            get_scheduler().schedule({
+                "channel_id": channel_id,
+                "user_id": user_id,
+                "message": message
+            }, send_at)
+            logger.info("⏰ Scheduled message for %s in %ds", channel_id, send_at - now)
+            return jsonify({
+                "success": True,
+                "scheduled": True,
+                "send_at": int(send_at),
+                "message": "Video scheduled for posting"
+            })
         
         # Send message to Telegram
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        logger.debug(f"Sending to Telegram: {url}")
-        
-        payload = {
-            "chat_id": channel_id,
-            "text": message,
-            "parse_mode": "Markdown",
-            "disable_web_page_preview": False
-        }
-        logger.debug(f"Payload: {payload}")
-        
-        response = requests.post(url, json=payload)
-        result = response.json()
-        
-        logger.debug(f"Telegram response: {result}")
+        result = send_to_telegram(channel_id, message)
         
         if result.get('ok'):
-            logger.info(f"✅ Message sent successfully to {channel_id}")
+            logger.info("✅ Message sent successfully to %s", channel_id)
             return jsonify({
                 "success": True,
                 "message": "Video posted successfully"
             })
         else:
             error_desc = result.get('description', 'Unknown error')
-            logger.error(f"❌ Telegram error: {error_desc}")
+            logger.error("❌ Telegram error: %s", error_desc)
             return jsonify({
                 "success": False,
                 "error": error_desc
             }), 400
             
     except Exception as e:
-        logger.error(f"❌ Exception in send_video: {str(e)}", exc_info=True)
+        logger.error("❌ Exception in send_video: %s", e, exc_info=True)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -128,7 +235,11 @@ def send_video():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "scheduled_posts": _scheduler.pending_count() if _scheduler else None,
+        "startup": timer.report()
+    })
 
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 5000))
@@ -137,4 +248,10 @@ if __name__ == "__main__":
     
     # Use debug mode only for local development
     debug_mode = os.getenv('ENVIRONMENT', 'local') == 'local'
+    
+    # The debug reloader runs this block twice; only the child process should send
+    if not debug_mode or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=run_scheduler, daemon=True).start()
+    
+    timer.ready()
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
\ No newline at end of file
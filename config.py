@@ -9,7 +9,7 @@ API_PORT = int(__import__('os').getenv('PORT', 5000))
 DEBUG_MODE = __import__('os').getenv('ENVIRONMENT', 'local') == 'local'
 
 # Bot Configuration
-CONFIG_FILE = "user_configs.json"
+DB_FILE = "telebot.db"  # User configs, bot state and scheduled posts (SQLite, see storage.py)
 LOGGING_LEVEL = "INFO"
 
 # Deployment Info
@@ -0,0 +1,124 @@
+"""
+Logging Setup - Queued, sampled, structured logging
+Used by: telebot.py, api_server.py
+
+Handlers only put records on a queue; a background thread formats and
+writes them. Messages are formatted there too, so pass values as logging
+args (logger.info("sent to %s", chat_id)) rather than pre-built f-strings,
+and don't mutate an object after logging it.
+
+Every request (API call or Telegram update) gets a request id and a
+sampling decision. Below WARNING, only sampled requests are logged.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import random
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+request_id_var = ContextVar("request_id", default=None)
+sampled_var = ContextVar("log_sampled", default=True)
+
+# Fraction of requests whose DEBUG/INFO records are kept (set by setup_logging)
+DEFAULT_SAMPLE_RATE = 0.1
+sample_rate = DEFAULT_SAMPLE_RATE
+
+
+def start_request(request_id=None):
+    """Tag log records from the current request/update and decide if it is sampled"""
+    request_id = str(request_id) if request_id is not None else uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    sampled_var.set(random.random() < sample_rate)
+    return request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request id and drop low-level records from unsampled requests"""
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not sampled_var.get():
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record):
+        # The stock prepare() formats msg % args on the calling thread
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _read_sample_rate():
+    """LOG_SAMPLE_RATE from the environment, falling back to the default if malformed"""
+    value = os.getenv('LOG_SAMPLE_RATE')
+    if value is None:
+        return DEFAULT_SAMPLE_RATE
+    try:
+        rate = float(value)
+        if math.isnan(rate):
+            raise ValueError(value)
+        return min(max(rate, 0.0), 1.0)
+    except ValueError:
+        logging.getLogger(__name__).warning(
+            "Invalid LOG_SAMPLE_RATE %r, using %s", value, DEFAULT_SAMPLE_RATE
+        )
+        return DEFAULT_SAMPLE_RATE
+
+
+def setup_logging(level=None):
+    """Route all logging through a queue to a background writer
+
+    Call after load_env() so LOG_* settings from .env are picked up.
+    """
+    global sample_rate
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+
+    handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+        ))
+    else:
+        handler.setFormatter(JsonFormatter())
+
+    queue = SimpleQueue()
+    listener = QueueListener(queue, handler, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued on shutdown
+    atexit.register(listener.stop)
+
+    queue_handler = DeferredQueueHandler(queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+    sample_rate = _read_sample_rate()
+    return listener
@@ -0,0 +1,104 @@
+"""
+Bot Persistence - Keeps conversation and user/bot data across restarts
+Used by: telebot.py
+
+Stores everything in the shared SQLite store (storage.py). python-telegram-bot
+only hands us the entries that changed, and each one is a single row write,
+so persisting never dumps the whole state.
+
+By default only conversation state is stored; this bot doesn't use
+bot_data, user_data or chat_data. Store calls run in a worker thread so
+the event loop never waits on SQLite.
+"""
+
+import asyncio
+import json
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import store
+
+# Namespaces in the shared store
+USER_DATA = "user_data"
+CHAT_DATA = "chat_data"
+BOT_DATA = "bot_data"
+CONVERSATIONS = "conversations:"
+
+
+class StorePersistence(BasePersistence):
+    """BasePersistence implementation backed by storage.Store"""
+
+    def __init__(self, kv_store=store, store_data=None, update_interval=5):
+        super().__init__(
+            store_data=store_data or PersistenceInput(
+                bot_data=False, chat_data=False, user_data=False, callback_data=False
+            ),
+            update_interval=update_interval
+        )
+        self.kv_store = kv_store
+
+    @staticmethod
+    def _conversation_key(key):
+        return json.dumps(list(key))
+
+    async def get_user_data(self):
+        items = await asyncio.to_thread(self.kv_store.items, USER_DATA)
+        return {int(key): value for key, value in items}
+
+    async def get_chat_data(self):
+        items = await asyncio.to_thread(self.kv_store.items, CHAT_DATA)
+        return {int(key): value for key, value in items}
+
+    async def get_bot_data(self):
+        return await asyncio.to_thread(self.kv_store.get, BOT_DATA, "bot", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # Only in-progress conversations are stored, so this stays small
+        items = await asyncio.to_thread(self.kv_store.items, CONVERSATIONS + name)
+        return {tuple(json.loads(key)): state for key, state in items}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await asyncio.to_thread(self.kv_store.delete, CONVERSATIONS + name, self._conversation_key(key))
+        else:
+            await asyncio.to_thread(self.kv_store.set, CONVERSATIONS + name, self._conversation_key(key), new_state)
+
+    async def update_user_data(self, user_id, data):
+        if data:
+            await asyncio.to_thread(self.kv_store.set, USER_DATA, user_id, data)
+        else:
+            await asyncio.to_thread(self.kv_store.delete, USER_DATA, user_id)
+
+    async def update_chat_data(self, chat_id, data):
+        if data:
+            await asyncio.to_thread(self.kv_store.set, CHAT_DATA, chat_id, data)
+        else:
+            await asyncio.to_thread(self.kv_store.delete, CHAT_DATA, chat_id)
+
+    async def update_bot_data(self, data):
+        await asyncio.to_thread(self.kv_store.set, BOT_DATA, "bot", data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await asyncio.to_thread(self.kv_store.delete, USER_DATA, user_id)
+
+    async def drop_chat_data(self, chat_id):
+        await asyncio.to_thread(self.kv_store.delete, CHAT_DATA, chat_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        # Every update is written straight through, nothing is buffered
+        pass
@@ -0,0 +1,297 @@
+"""
+Post Scheduler - Delayed and quiet-hours posting
+Used by: api_server.py
+
+Pending posts live in a hierarchical timer wheel (O(1) insert, cheap ticks)
+and are stored one row per post in the shared SQLite store (storage.py) so
+they survive restarts.
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from storage import store, SCHEDULED_POSTS
+
+logger = logging.getLogger(__name__)
+
+# Posts held by quiet hours are released at a random point within this
+# many seconds after the window ends, so they don't all hit Telegram at once
+QUIET_HOURS_SPREAD = 15 * 60
+
+# Failed sends are retried after RETRY_BASE_DELAY * 2**(attempt - 1) seconds
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+
+
+class RetrySend(Exception):
+    """Raised by a send function when a post should be tried again later
+
+    seconds overrides the backoff delay, e.g. Telegram's retry_after.
+    """
+
+    def __init__(self, reason, seconds=None):
+        super().__init__(reason)
+        self.seconds = seconds
+
+
+def compute_send_time(config, now=None):
+    """Work out when a post should go out based on the user's delay and quiet hours
+
+    Posts that land in quiet hours are released at a random time within
+    QUIET_HOURS_SPREAD seconds after the window ends.
+    """
+    now = time.time() if now is None else now
+    send_at = now + int(config.get("delay_minutes", 0)) * 60
+
+    quiet = config.get("quiet_hours")
+    if not quiet:
+        return send_at
+
+    start, end = int(quiet["start"]), int(quiet["end"])
+    if start == end:
+        return send_at
+
+    # Quiet hours are stored as local hours with a fixed UTC offset
+    tz = timezone(timedelta(hours=int(quiet.get("utc_offset", 0))))
+    local = datetime.fromtimestamp(send_at, tz)
+    hour = local.hour
+
+    if start < end:
+        in_quiet = start <= hour < end
+    else:
+        # Window wraps past midnight, e.g. 23-7
+        in_quiet = hour >= start or hour < end
+
+    if not in_quiet:
+        return send_at
+
+    release = local.replace(hour=end, minute=0, second=0, microsecond=0)
+    if release <= local:
+        release += timedelta(days=1)
+    return release.timestamp() + random.uniform(0, QUIET_HOURS_SPREAD)
+
+
+class TimerWheel:
+    """Hierarchical timer wheel keyed by integer ticks
+
+    Level 0 holds entries due within `slots` ticks, level 1 within slots**2,
+    and so on. Entries cascade down a level each time their bucket comes up.
+    Anything beyond the top level waits in an overflow list.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = self._to_tick(time.time() if now is None else now)
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.count = 0
+
+    def _to_tick(self, timestamp):
+        return int(timestamp // self.tick)
+
+    def _place(self, expires, key):
+        """Put an entry into the right bucket (expires must be >= current)"""
+        delta = expires - self.current
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span:
+                index = (expires // (span // self.slots)) % self.slots
+                self.wheels[level][index].append((expires, key))
+                return
+            span *= self.slots
+        self.overflow.append((expires, key))
+
+    def add(self, key, timestamp):
+        """Schedule key to fire at timestamp"""
+        expires = max(self._to_tick(timestamp), self.current + 1)
+        self._place(expires, key)
+        self.count += 1
+
+    def advance(self, timestamp):
+        """Move the wheel forward to timestamp and return every key that fired"""
+        target = self._to_tick(timestamp)
+        fired = []
+
+        # Nothing pending - skip straight ahead instead of walking empty ticks
+        if self.count == 0:
+            self.current = max(self.current, target)
+            return fired
+
+        while self.current < target and self.count:
+            self.current += 1
+
+            # Cascade higher levels first so their entries can land in level 0
+            if self.current % (self.slots ** self.levels) == 0:
+                pending, self.overflow = self.overflow, []
+                for expires, key in pending:
+                    self._place(expires, key)
+            for level in range(self.levels - 1, 0, -1):
+                size = self.slots ** level
+                if self.current % size == 0:
+                    index = (self.current // size) % self.slots
+                    bucket = self.wheels[level][index]
+                    self.wheels[level][index] = []
+                    for expires, key in bucket:
+                        self._place(expires, key)
+
+            index = self.current % self.slots
+            bucket = self.wheels[0][index]
+            if bucket:
+                self.wheels[0][index] = []
+                fired.extend(key for _, key in bucket)
+                self.count -= len(bucket)
+
+        self.current = max(self.current, target)
+        return fired
+
+
+class PostScheduler:
+    """Thread-safe set of pending posts, one row each in the shared store"""
+
+    def __init__(self, kv_store=store):
+        self.kv_store = kv_store
+        self.lock = threading.Lock()
+        self.wheel = TimerWheel()
+        self.posts = {}
+        # Pending posts are read from the store on first use, not at construction
+        self.loaded = False
+
+    def _ensure_loaded(self):
+        """Load pending posts if that hasn't happened yet (call with lock held)"""
+        if not self.loaded:
+            self._load()
+            self.loaded = True
+
+    @staticmethod
+    def _is_valid(record):
+        """Check a stored post has the fields the scheduler relies on"""
+        return (
+            isinstance(record, dict)
+            and isinstance(record.get("send_at"), (int, float))
+            and isinstance(record.get("post"), dict)
+        )
+
+    def _load(self):
+        """Rebuild the wheel from the posts in the store"""
+        posts = {}
+        for post_id, record in self.kv_store.items(SCHEDULED_POSTS):
+            if not self._is_valid(record):
+                logger.warning("Skipping invalid scheduled post %s: %s", post_id, record)
+                continue
+            posts[post_id] = record
+
+        self.posts = posts
+        for post_id, record in posts.items():
+            self.wheel.add(post_id, record["send_at"])
+
+        logger.info("Loaded %d scheduled posts", len(posts))
+
+    def schedule(self, post, send_at):
+        """Queue a post (dict with channel_id, message, user_id) for send_at"""
+        post_id = uuid.uuid4().hex
+        record = {"send_at": send_at, "post": post}
+        with self.lock:
+            self._ensure_loaded()
+            self.kv_store.set(SCHEDULED_POSTS, post_id, record)
+            self.posts[post_id] = record
+            self.wheel.add(post_id, send_at)
+        return post_id
+
+    def pop_due(self, now=None):
+        """Return (post_id, post) pairs whose send time has passed"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._ensure_loaded()
+            due = self.wheel.advance(now)
+            return [(post_id, self.posts[post_id]["post"]) for post_id in due if post_id in self.posts]
+
+    def retry(self, post_id, delay):
+        """Put a failed post back in the wheel, or drop it after MAX_ATTEMPTS
+
+        Returns False if the post was given up on.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            record = self.posts.get(post_id)
+            if record is None:
+                return False
+            attempts = record.get("attempts", 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                return False
+            record = dict(record, send_at=time.time() + delay, attempts=attempts)
+            self.kv_store.set(SCHEDULED_POSTS, post_id, record)
+            self.posts[post_id] = record
+            self.wheel.add(post_id, record["send_at"])
+            return True
+
+    def mark_done(self, post_id):
+        """Record that a post was sent (or given up on)"""
+        with self.lock:
+            self._ensure_loaded()
+            if self.posts.pop(post_id, None) is None:
+                return
+            self.kv_store.delete(SCHEDULED_POSTS, post_id)
+
+    def pending_count(self):
+        """Number of pending posts, or None while they are still loading"""
+        if not self.loaded:
+            return None
+        with self.lock:
+            return len(self.posts)
+
+    def _send(self, send_func, post_id, post):
+        """Send one post, re-queueing it with backoff only if send_func asks for a retry"""
+        try:
+            if not send_func(post):
+                logger.error("❌ Dropping scheduled post %s", post_id)
+            self.mark_done(post_id)
+            return
+        except RetrySend as e:
+            logger.warning("Scheduled post %s failed: %s", post_id, e)
+            retry_after = e.seconds
+        except Exception as e:
+            # We can't tell whether the post went out, so don't risk a duplicate
+            logger.error("❌ Dropping scheduled post %s after unexpected error: %s", post_id, e)
+            self.mark_done(post_id)
+            return
+
+        attempts = self.posts.get(post_id, {}).get("attempts", 0)
+        delay = retry_after if retry_after is not None else RETRY_BASE_DELAY * 2 ** attempts
+        if self.retry(post_id, delay):
+            logger.warning("Retrying scheduled post %s in %ss", post_id, delay)
+        else:
+            logger.error("❌ Giving up on scheduled post %s after %d attempts", post_id, MAX_ATTEMPTS)
+            self.mark_done(post_id)
+
+    def run(self, send_func, interval=1.0, stop_event=None):
+        """Loop forever sending due posts
+
+        send_func(post) returns True once the post is sent and False if it
+        failed for good. It raises RetrySend only when the post certainly
+        wasn't delivered and may succeed later; the post is then retried
+        with backoff. Any other exception drops the post.
+
+        Delivery is at least once: a crash between send_func returning and
+        mark_done deleting the row resends the post after restart.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                for post_id, post in self.pop_due():
+                    self._send(send_func, post_id, post)
+            except Exception:
+                # Keep the sender alive; a failed load is retried next tick
+                logger.exception("❌ Scheduler loop error")
+            stop_event.wait(interval)
+
+    def start(self, send_func, interval=1.0):
+        """Run the send loop on a daemon thread"""
+        thread = threading.Thread(target=self.run, args=(send_func, interval), daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,56 @@
+"""
+Startup Timing - Time-to-ready breakdown for the bot and API processes
+Used by: telebot.py, api_server.py
+
+Import this first so the clock starts as early as possible.
+"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Records how long each startup phase takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = {}
+        self.total_ms = None
+
+    def mark(self, phase):
+        """Record the time since the previous mark as phase"""
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self.last) * 1000, 1)
+        self.last = now
+
+    def ready(self, phase="ready"):
+        """Close the last phase and log the full breakdown"""
+        self.mark(phase)
+        self.total_ms = round((self.last - self.started) * 1000, 1)
+        logger.info(
+            "🚀 Ready in %.1f ms (%s)",
+            self.total_ms,
+            ", ".join(f"{name}={ms}ms" for name, ms in self.phases.items())
+        )
+
+    def report(self):
+        """Timing breakdown as a dict (total_ms is None until ready)"""
+        return {"total_ms": self.total_ms, "phases_ms": dict(self.phases)}
+
+
+def load_env():
+    """Load .env for local development, skipping python-dotenv when there is no file"""
+    # Deployments set real environment variables, so there's nothing to read
+    for path in (".env", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")):
+        if os.path.exists(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+
+# Timer for this process, started on first import
+timer = StartupTimer()
@@ -0,0 +1,113 @@
+"""
+Storage - SQLite key/value store shared by the bot and the API server
+Used by: telebot.py, api_server.py, persistence.py, scheduler.py
+
+Each entry is its own row, so saving one user's settings only writes that
+user's row instead of rewriting every config. The database is opened on
+first use, not at import time.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from config import DB_FILE
+
+logger = logging.getLogger(__name__)
+
+# Namespaces
+USER_CONFIGS = "user_configs"
+SCHEDULED_POSTS = "scheduled_posts"
+
+# Old JSON files imported once into an empty namespace
+LEGACY_FILES = {
+    USER_CONFIGS: "user_configs.json",
+}
+
+
+class Store:
+    """Namespaced JSON key/value store on top of SQLite"""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self._conn = None
+
+    @property
+    def conn(self):
+        """Open the database on first use"""
+        if self._conn is None:
+            with self.lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL lets the bot and API processes read while the other writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        self._import_legacy(conn)
+        return conn
+
+    def _import_legacy(self, conn):
+        """Copy data from the old JSON files the first time the database is created"""
+        for namespace, filename in LEGACY_FILES.items():
+            if not os.path.exists(filename):
+                continue
+            row = conn.execute("SELECT 1 FROM kv WHERE namespace = ? LIMIT 1", (namespace,)).fetchone()
+            if row:
+                continue
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                    [(namespace, str(key), json.dumps(value, ensure_ascii=False)) for key, value in data.items()]
+                )
+            logger.info("Imported %d entries from %s into %s", len(data), filename, self.path)
+
+    def get(self, namespace, key, default=None):
+        """Return the value stored under key, or default"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, str(key))
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        """Store value under key, replacing any previous value"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, str(key), json.dumps(value, ensure_ascii=False))
+            )
+
+    def delete(self, namespace, key):
+        """Remove key if present"""
+        with self.lock:
+            self.conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, str(key)))
+
+    def items(self, namespace):
+        """Return every (key, value) pair in a namespace"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+
+# Shared store for this process
+store = Store()
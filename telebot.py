@@ -6,6 +6,7 @@ Run: python bot_server.py
 Users can configure message format via Telegram commands!
 """
 
+from startup import timer, load_env
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, 
@@ -14,21 +15,28 @@ from telegram.ext import (
     MessageHandler,
     filters,
     ContextTypes,
-    ConversationHandler
+    ConversationHandler,
+    TypeHandler
 )
+import asyncio
 import logging
 import json
 import os
-from dotenv import load_dotenv
+timer.mark("import_telegram")
+
+from storage import store, USER_CONFIGS
+from persistence import StorePersistence
+from log_setup import setup_logging, start_request
+timer.mark("import_app")
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 # Setup logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
+# httpx logs every getUpdates poll at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+timer.mark("setup_logging")
 
 # Load bot token from environment variable for security
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -36,24 +44,20 @@ if not BOT_TOKEN:
     raise ValueError("Please set the TELEGRAM_BOT_TOKEN environment variable")
 
 # Conversation states
-WAITING_FOR_FORMAT, WAITING_FOR_EMOJI = range(2)
+WAITING_FOR_FORMAT, WAITING_FOR_EMOJI, WAITING_FOR_DELAY, WAITING_FOR_QUIET_HOURS = range(4)
 
-# File to store user configurations
-CONFIG_FILE = "user_configs.json"
+# File to store notified channels
 CHANNELS_NOTIFIED_FILE = "channels_notified.json"
 
-# Load/Save configurations
-def load_configs():
-    """Load user configurations from file"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+# Load/Save configurations (one user at a time, nothing is read up front)
+# SQLite can wait on the API process's write lock, so keep it off the event loop
+async def get_config(user_id):
+    """Load one user's configuration from the store (None if not set)"""
+    return await asyncio.to_thread(store.get, USER_CONFIGS, user_id)
 
-def save_configs(configs):
-    """Save user configurations to file"""
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(configs, f, indent=2, ensure_ascii=False)
+async def save_config(user_id, config):
+    """Save one user's configuration to the store"""
+    await asyncio.to_thread(store.set, USER_CONFIGS, user_id, config)
 
 def load_notified_channels():
     """Load list of channels already notified"""
@@ -80,20 +84,26 @@ def mark_channel_notified(chat_id):
         channels.append(chat_id_str)
         save_notified_channels(channels)
 
-# Global config storage
-user_configs = load_configs()
+async def on_ready(application: Application):
+    """Runs once persistence is loaded, right before polling starts"""
+    timer.ready("initialize")
+
+async def tag_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Give each update a request id for log correlation"""
+    start_request(update.update_id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message when /start is issued"""
     user_id = str(update.effective_user.id)
     
     # Initialize default config if new user
-    if user_id not in user_configs:
-        user_configs[user_id] = {
+    config = await get_config(user_id)
+    if config is None:
+        config = {
             "message_format": "now playing",
             "emoji": "🎵"
         }
-        save_configs(user_configs)
+        await save_config(user_id, config)
     
     welcome_text = """
 🎵 *Welcome to YouTube to Telegram Bot!*
@@ -109,6 +119,8 @@ I can automatically post YouTube videos you're watching to your Telegram channel
 *Customize Your Messages:*
 • /setformat - Change message format
 • /setemoji - Change emoji
+• /setdelay - Delay your posts
+• /setquiethours - Hold posts during quiet hours
 • /preview - See how your messages will look
 • /myconfig - View your current settings
 
@@ -151,6 +163,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 *Configuration Commands:*
 /setformat - Set message text (e.g., "now playing", "listening to")
 /setemoji - Set emoji (e.g., 🎵, 🎧, 📻)
+/setdelay - Delay posts by N minutes (0 to post instantly)
+/setquiethours - Hold posts during quiet hours (e.g., 23-7)
 /preview - Preview how messages will look
 /myconfig - View current settings
 /reset - Reset to default settings
@@ -185,11 +199,12 @@ async def receive_format(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_format = update.message.text.strip()
     
     # Update config
-    if user_id not in user_configs:
-        user_configs[user_id] = {"emoji": "🎵"}
+    config = await get_config(user_id)
+    if config is None:
+        config = {"emoji": "🎵"}
     
-    user_configs[user_id]["message_format"] = new_format
-    save_configs(user_configs)
+    config["message_format"] = new_format
+    await save_config(user_id, config)
     
     await update.message.reply_text(
         f"✅ *Format Updated!*\n\n"
@@ -242,11 +257,12 @@ async def emoji_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(query.from_user.id)
     
     # Update config
-    if user_id not in user_configs:
-        user_configs[user_id] = {"message_format": "now playing"}
+    config = await get_config(user_id)
+    if config is None:
+        config = {"message_format": "now playing"}
     
-    user_configs[user_id]["emoji"] = emoji
-    save_configs(user_configs)
+    config["emoji"] = emoji
+    await save_config(user_id, config)
     
     await query.edit_message_text(
         f"✅ *Emoji Updated!*\n\n"
@@ -262,11 +278,12 @@ async def receive_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_emoji = update.message.text.strip()
     
     # Update config
-    if user_id not in user_configs:
-        user_configs[user_id] = {"message_format": "now playing"}
+    config = await get_config(user_id)
+    if config is None:
+        config = {"message_format": "now playing"}
     
-    user_configs[user_id]["emoji"] = new_emoji
-    save_configs(user_configs)
+    config["emoji"] = new_emoji
+    await save_config(user_id, config)
     
     await update.message.reply_text(
         f"✅ *Emoji Updated!*\n\n"
@@ -276,18 +293,140 @@ async def receive_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+async def set_delay(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start conversation to set posting delay"""
+    await update.message.reply_text(
+        "⏰ *Set Posting Delay*\n\n"
+        "Send me how many minutes to wait before each video is posted.\n\n"
+        "*Examples:*\n"
+        "• 0 - post instantly\n"
+        "• 15 - post 15 minutes later\n"
+        "• 60 - post an hour later\n\n"
+        "Or send /cancel to cancel.",
+        parse_mode='Markdown'
+    )
+    return WAITING_FOR_DELAY
+
+async def receive_delay(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Receive and save the posting delay"""
+    user_id = str(update.effective_user.id)
+    text = update.message.text.strip()
+    
+    if not text.isdecimal() or int(text) > 10080:
+        await update.message.reply_text(
+            "❌ Please send a whole number of minutes between 0 and 10080 (one week).",
+            parse_mode='Markdown'
+        )
+        return WAITING_FOR_DELAY
+    
+    delay = int(text)
+    
+    # Update config
+    config = await get_config(user_id)
+    if config is None:
+        config = {"message_format": "now playing", "emoji": "🎵"}
+    
+    config["delay_minutes"] = delay
+    await save_config(user_id, config)
+    
+    await update.message.reply_text(
+        f"✅ *Delay Updated!*\n\n"
+        f"Your posts will go out {f'{delay} minutes after you watch' if delay else 'instantly'}.\n\n"
+        f"Use /myconfig to see all your settings!",
+        parse_mode='Markdown'
+    )
+    return ConversationHandler.END
+
+async def set_quiet_hours(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start conversation to set quiet hours"""
+    await update.message.reply_text(
+        "🌙 *Set Quiet Hours*\n\n"
+        "Posts during quiet hours are held and sent within 15 minutes after they end.\n"
+        "Send the start and end hour (0-23), optionally with your UTC offset.\n\n"
+        "*Examples:*\n"
+        "• 23-7 - quiet from 23:00 to 07:00 UTC\n"
+        "• 22-8 +2 - quiet from 22:00 to 08:00 UTC+2\n"
+        "• off - disable quiet hours\n\n"
+        "Or send /cancel to cancel.",
+        parse_mode='Markdown'
+    )
+    return WAITING_FOR_QUIET_HOURS
+
+def parse_quiet_hours(text):
+    """Parse '23-7' or '23-7 +2' into a quiet_hours dict (None if invalid)"""
+    parts = text.split()
+    if len(parts) not in (1, 2):
+        return None
+    
+    try:
+        start, end = (int(h) for h in parts[0].split("-"))
+        utc_offset = int(parts[1].upper().replace("UTC", "")) if len(parts) == 2 else 0
+    except ValueError:
+        return None
+    
+    if not (0 <= start <= 23 and 0 <= end <= 23 and -12 <= utc_offset <= 14) or start == end:
+        return None
+    return {"start": start, "end": end, "utc_offset": utc_offset}
+
+async def receive_quiet_hours(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Receive and save quiet hours"""
+    user_id = str(update.effective_user.id)
+    text = update.message.text.strip()
+    
+    # Update config
+    config = await get_config(user_id)
+    if config is None:
+        config = {"message_format": "now playing", "emoji": "🎵"}
+    
+    if text.lower() == "off":
+        config.pop("quiet_hours", None)
+        await save_config(user_id, config)
+        await update.message.reply_text(
+            "✅ *Quiet Hours Disabled!*\n\n"
+            "Your posts will no longer be held back.",
+            parse_mode='Markdown'
+        )
+        return ConversationHandler.END
+    
+    quiet_hours = parse_quiet_hours(text)
+    if quiet_hours is None:
+        await update.message.reply_text(
+            "❌ I couldn't read that. Send something like `23-7` or `22-8 +2`, or `off`.",
+            parse_mode='Markdown'
+        )
+        return WAITING_FOR_QUIET_HOURS
+    
+    config["quiet_hours"] = quiet_hours
+    await save_config(user_id, config)
+    
+    await update.message.reply_text(
+        f"✅ *Quiet Hours Updated!*\n\n"
+        f"Quiet hours: `{format_quiet_hours(quiet_hours)}`\n\n"
+        f"Posts during this time will be spread over the 15 minutes after it ends.",
+        parse_mode='Markdown'
+    )
+    return ConversationHandler.END
+
+def format_quiet_hours(quiet_hours):
+    """Format a quiet_hours dict for display"""
+    if not quiet_hours:
+        return "off"
+    offset = quiet_hours.get("utc_offset", 0)
+    zone = f"UTC{offset:+d}" if offset else "UTC"
+    return f"{quiet_hours['start']:02d}:00-{quiet_hours['end']:02d}:00 {zone}"
+
 async def preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show preview of how messages will look"""
     user_id = str(update.effective_user.id)
     
-    if user_id not in user_configs:
-        user_configs[user_id] = {
+    config = await get_config(user_id)
+    if config is None:
+        config = {
             "message_format": "now playing",
             "emoji": "🎵"
         }
-        save_configs(user_configs)
+        await save_config(user_id, config)
     
-    config = user_configs[user_id]
     emoji = config.get("emoji", "🎵")
     message_format = config.get("message_format", "now playing")
     
@@ -309,24 +448,27 @@ async def my_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's current configuration"""
     user_id = str(update.effective_user.id)
     
-    if user_id not in user_configs:
-        user_configs[user_id] = {
+    config = await get_config(user_id)
+    if config is None:
+        config = {
             "message_format": "now playing",
             "emoji": "🎵"
         }
-        save_configs(user_configs)
-    
-    config = user_configs[user_id]
+        await save_config(user_id, config)
     
     config_text = f"""
 *⚙️ Your Current Settings*
 
 *Emoji:* {config.get('emoji', '🎵')}
 *Message Format:* `{config.get('message_format', 'now playing')}`
+*Delay:* {config.get('delay_minutes', 0)} min
+*Quiet Hours:* `{format_quiet_hours(config.get('quiet_hours'))}`
 
 *Commands to Change:*
 • /setformat - Change message text
 • /setemoji - Change emoji
+• /setdelay - Change posting delay
+• /setquiethours - Change quiet hours
 • /preview - See how it looks
 • /reset - Reset to defaults
     """
@@ -337,11 +479,11 @@ async def reset_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reset user configuration to defaults"""
     user_id = str(update.effective_user.id)
     
-    user_configs[user_id] = {
+    config = {
         "message_format": "now playing",
         "emoji": "🎵"
     }
-    save_configs(user_configs)
+    await save_config(user_id, config)
     
     await update.message.reply_text(
         "🔄 *Settings Reset!*\n\n"
@@ -386,7 +528,7 @@ async def handle_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Check if we already notified this channel
         if is_channel_notified(chat_id):
-            logging.info(f"Channel {chat_id} already notified, skipping")
+            logging.info("Channel %s already notified, skipping", chat_id)
             return
         
         await context.bot.send_message(
@@ -400,7 +542,7 @@ async def handle_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Mark this channel as notified
         mark_channel_notified(chat_id)
-        logging.info(f"Sent notification to channel {chat_id}")
+        logging.info("Sent notification to channel %s", chat_id)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel the conversation"""
@@ -481,7 +623,7 @@ async def download_extension(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 "Extension file not found. Please contact support.",
                 parse_mode='Markdown'
             )
-            logging.warning(f"Extension ZIP file not found")
+            logging.warning("Extension ZIP file not found")
             return
         
         # Send the file
@@ -492,7 +634,7 @@ async def download_extension(update: Update, context: ContextTypes.DEFAULT_TYPE)
             parse_mode='Markdown'
         )
         
-        logging.info(f"User {user_id} downloaded the extension from {extension_zip_path}")
+        logging.info("User %s downloaded the extension from %s", user_id, extension_zip_path)
         
     except Exception as e:
         await update.message.reply_text(
@@ -500,7 +642,7 @@ async def download_extension(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "Please try again or contact /support",
             parse_mode='Markdown'
         )
-        logging.error(f"Error sending extension to user {user_id}: {str(e)}")
+        logging.error("Error sending extension to user %s: %s", user_id, e)
 
 async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send support information"""
@@ -533,7 +675,16 @@ def main():
             return
             
         print(f"Starting bot with token: {BOT_TOKEN[:5]}...")
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .persistence(StorePersistence())
+            .post_init(on_ready)
+            .build()
+        )
+        
+        # Runs before every other handler
+        application.add_handler(TypeHandler(Update, tag_update), group=-1)
         
         # Command handlers
         application.add_handler(CommandHandler("start", start))
@@ -559,6 +710,8 @@ def main():
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="format_conv",
+        persistent=True,
     )
     application.add_handler(format_conv)
     
@@ -572,9 +725,39 @@ def main():
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="emoji_conv",
+        persistent=True,
     )
     application.add_handler(emoji_conv)
     
+    # Conversation handler for setting posting delay
+    delay_conv = ConversationHandler(
+        entry_points=[CommandHandler("setdelay", set_delay)],
+        states={
+            WAITING_FOR_DELAY: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_delay)
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="delay_conv",
+        persistent=True,
+    )
+    application.add_handler(delay_conv)
+    
+    # Conversation handler for setting quiet hours
+    quiet_hours_conv = ConversationHandler(
+        entry_points=[CommandHandler("setquiethours", set_quiet_hours)],
+        states={
+            WAITING_FOR_QUIET_HOURS: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_quiet_hours)
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="quiet_hours_conv",
+        persistent=True,
+    )
+    application.add_handler(quiet_hours_conv)
+    
     # Channel post handler
     application.add_handler(
         MessageHandler(filters.ChatType.CHANNEL, handle_channel_post)
@@ -584,6 +767,7 @@ def main():
     print("Users can now customize their message format via Telegram commands")
     print("Press Ctrl+C to stop")
     
+    timer.mark("build_application")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":